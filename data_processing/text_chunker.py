@@ -1,17 +1,27 @@
+import re
 from typing import List, Dict
 from my_config import config
 
+# Sentence boundary: terminal punctuation (incl. CJK) followed by whitespace, or a blank line
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?。！？])\s+|\n\s*\n")
+
 class TextChunker:
-    def __init__(self):
+    def __init__(self, tokenizer=None, max_tokens: int = None):
+        """Character chunking by default; with config.CHUNK_MODE == "tokens" and a tokenizer, chunks are
+        packed from whole sentences up to max_tokens (the embedding model's max sequence length)."""
         self.chunk_size = config.CHUNK_SIZE
         self.chunk_overlap = config.CHUNK_OVERLAP
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.token_overlap = config.CHUNK_TOKEN_OVERLAP
+        self.use_tokens = config.CHUNK_MODE == "tokens" and tokenizer is not None and bool(max_tokens)
     
     def chunk_documents(self, documents: List[Dict]) -> List[Dict]:
         """Split documents into chunks"""
         chunked_docs = []
         
         for doc in documents:
-            chunks = self._chunk_text(doc["text"])
+            chunks = self._chunk_text_tokens(doc["text"]) if self.use_tokens else self._chunk_text(doc["text"])
             
             for i, chunk in enumerate(chunks):
                 chunked_docs.append({
@@ -35,4 +45,68 @@ class TextChunker:
             start += self.chunk_size - self.chunk_overlap
             end = start + self.chunk_size
         
+        return chunks
+
+    def _count_tokens(self, pieces: List[str]) -> List[int]:
+        if not pieces:
+            return []
+        return [len(ids) for ids in self.tokenizer(pieces, add_special_tokens=False)["input_ids"]]
+
+    def _split_tokens(self, word: str, budget: int) -> List[tuple]:
+        """Split a single over-budget word (long peptide sequence, URL) into budget-sized token windows."""
+        ids = self.tokenizer(word, add_special_tokens=False)["input_ids"]
+        texts = [self.tokenizer.decode(ids[i:i + budget]).strip() for i in range(0, len(ids), budget)]
+        texts = [t for t in texts if t]
+        return list(zip(texts, self._count_tokens(texts)))
+
+    def _split_long(self, sentence: str, budget: int) -> List[tuple]:
+        """Split a sentence longer than the budget at word boundaries into (text, n_tokens) pieces;
+        single words still over budget are split by token ids."""
+        words = sentence.split()
+        pieces, current, current_len = [], [], 0
+        for word, n in zip(words, self._count_tokens(words)):
+            if n > budget:
+                if current:
+                    pieces.append((" ".join(current), current_len))
+                    current, current_len = [], 0
+                pieces.extend(self._split_tokens(word, budget))
+                continue
+            if current and current_len + n > budget:
+                pieces.append((" ".join(current), current_len))
+                current, current_len = [], 0
+            current.append(word)
+            current_len += n
+        if current:
+            pieces.append((" ".join(current), current_len))
+        return pieces
+
+    def _chunk_text_tokens(self, text: str) -> List[str]:
+        """Token-aware chunking: greedily pack whole sentences up to the encoder window, with sentence overlap."""
+        budget = self.max_tokens - 2  # room for the [CLS]/[SEP] special tokens
+        sentences = [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+        units: List[tuple] = []
+        for sentence, n in zip(sentences, self._count_tokens(sentences)):
+            if n > budget:
+                units.extend(self._split_long(sentence, budget))
+            else:
+                units.append((sentence, n))
+
+        chunks: List[str] = []
+        current: List[tuple] = []
+        current_len = 0
+        for sentence, n in units:
+            if current and current_len + n > budget:
+                chunks.append(" ".join(s for s, _ in current))
+                # Carry trailing sentences (up to the token overlap) into the next chunk
+                carried, carried_len = [], 0
+                for s, m in reversed(current):
+                    if carried_len + m > self.token_overlap or carried_len + m + n > budget:
+                        break
+                    carried.insert(0, (s, m))
+                    carried_len += m
+                current, current_len = carried, carried_len
+            current.append((sentence, n))
+            current_len += n
+        if current:
+            chunks.append(" ".join(s for s, _ in current))
         return chunks
\ No newline at end of file
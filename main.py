@@ -1,47 +1,63 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
-from data_processing.pdf_loader import PDFLoader
-from data_processing.text_chunker import TextChunker
-from models.embedding import EmbeddingModel
-from retrieval.vector_db import VectorDB
-from retrieval.retriever import Retriever
+from retrieval.session import ConversationCache, ConversationState
+from retrieval.keywords import get_keyword_matcher
 from generation.generator import ResponseGenerator
+from models.dispatch import get_llm_dispatcher
 
 from my_config import config
-import numpy as np
 import os
-import pickle
-import faiss
+from contextlib import nullcontext
 
 class AntimicrobialRAG:
-    def __init__(self, pdf_folder: str):
+    def __init__(self, pdf_folder: str, shards: dict = None):
         self.pdf_folder = pdf_folder
+        # Named shards (name -> PDF folder); defaults to config.SHARDS, else a single shard for pdf_folder
+        self.shard_folders = shards or config.SHARDS or {"default": pdf_folder}
+        # Optional admission gates (serving.admission.AdmissionGate) for embedding/search and LLM streams
+        self.search_gate = None
+        self.llm_gate = None
         self._initialize_components()
 
+    @staticmethod
+    def _admit(gate):
+        """Slot on an admission gate (raises serving.admission.Overloaded when saturated); no-op without one."""
+        return gate.slot() if gate is not None else nullcontext()
+
+    @staticmethod
+    def _precheck(gate):
+        """Fail fast (serving.admission.Overloaded) if the gate is already saturated, before doing costly work."""
+        if gate is not None:
+            gate.check()
+
     def _initialize_components(self):
-        """Initialize components (no disk cache; encode and build index on each startup)."""
-        # 1) Load PDFs and chunk documents
-        pdf_loader = PDFLoader(self.pdf_folder)
-        documents = pdf_loader.load_pdfs()
-        chunker = TextChunker()
-        self.chunked_documents = chunker.chunk_documents(documents)
-
-        # 2) Encode all chunk texts
-        self.embedding_model = EmbeddingModel()
-        embeddings = self.embedding_model.encode(
-            [doc["text"] for doc in self.chunked_documents]
-        ).cpu().numpy()
-        if embeddings.dtype != np.float32:
-            embeddings = embeddings.astype(np.float32)
-
-        # 3) Build vector index (memory only, no persistence)
-        self.vector_db = VectorDB(embeddings.shape[1])
-        self.vector_db.add_documents(embeddings, self.chunked_documents)
+        """Initialize components: build (or, with config.INDEX_DIR set, load) each shard's index independently.
+
+        With config.RETRIEVAL_SERVICE_ADDRESS set, retrieval runs in the standalone retrieval service instead
+        and only a thin client is created here (no torch, model or index in this process).
+        """
+        self.keyword_matcher = get_keyword_matcher()
+        if config.RETRIEVAL_SERVICE_ADDRESS:
+            from serving.retrieval_client import RetrievalClient
+            self.retriever = RetrievalClient(config.RETRIEVAL_SERVICE_ADDRESS, self.keyword_matcher)
+        else:
+            from models.embedding import EmbeddingModel
+            from retrieval.retriever import Retriever
+            from retrieval.shards import ShardedVectorDB, load_or_build_shards
+
+            # 1) Per shard: load PDFs, chunk, precompute keyword hit bitsets, encode and index
+            self.embedding_model = EmbeddingModel()
+            self.shards = load_or_build_shards(self.shard_folders, self.embedding_model, self.keyword_matcher)
+
+            # 2) Fan-out search over all shards behind the VectorDB interface
+            self.vector_db = ShardedVectorDB(self.shards)
+            self.chunked_documents = self.vector_db.documents
+            self.retriever = Retriever(self.vector_db, self.embedding_model, self.keyword_matcher)
 
         # Initialize other components
-        self.embedding_model = EmbeddingModel()
-        self.retriever = Retriever(self.vector_db, self.embedding_model)
         self.generator = ResponseGenerator()
+        # Per-conversation retrieval state for follow-up questions
+        self.sessions = ConversationCache()
 
     def _expand_to_full_document(self, relevant_docs):
         """Expand to include all chunks from the top-scoring document source.
@@ -52,93 +68,125 @@ class AntimicrobialRAG:
         top_source = relevant_docs[0].get("source")
         if not top_source:
             return relevant_docs
-        # Collect all chunks from the same source and sort by chunk_id for natural order
-        full_docs = [d for d in self.vector_db.documents if d.get("source") == top_source]
-        full_docs.sort(key=lambda d: d.get("chunk_id", 0))
-        return full_docs
-
-
+        # Collect all chunks from the same source (within the same shard), in chunk_id order
+        return self.retriever.source_documents(relevant_docs[0].get("shard"), top_source)
 
-    def _is_amp_related_query(self, question: str) -> bool:
-        """Check if the query is related to antimicrobial peptides"""
-        question_lower = question.lower()
 
-        # Simple greetings and casual conversation
-        casual_patterns = [
-            'hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening',
-            'how are you', 'what\'s up', 'thanks', 'thank you', 'bye', 'goodbye',
-            'test', 'testing', '你好', '谢谢', '再见'
-        ]
 
-        # Non-AMP topics that should be filtered out
-        non_amp_topics = [
-            'machine learning', 'deep learning', 'artificial intelligence', 'ai',
-            'programming', 'python', 'javascript', 'coding', 'software',
-            'weather', 'news', 'politics', 'sports', 'music', 'movie',
-            'recipe', 'cooking', 'travel', 'history', 'geography',
-            'math', 'physics', 'chemistry' # unless specifically about AMP chemistry
-        ]
+    def _is_amp_related_query(self, question: str, follow_up: bool = False) -> bool:
+        """Check if the query is related to antimicrobial peptides (single automaton pass over all vocabularies)"""
+        km = self.keyword_matcher
+        hits = km.match(question)
 
         # If it's just a casual greeting, return False
-        if any(pattern in question_lower for pattern in casual_patterns) and len(question.strip()) < 30:
+        if km.has_any(hits, "casual") and len(question.strip()) < 30:
             return False
 
         # If it contains non-AMP topics, return False
-        if any(topic in question_lower for topic in non_amp_topics):
-            # Exception: if it also contains AMP keywords, it might be AMP-related
-            amp_keywords = [
-                'antimicrobial', 'peptide', 'amp', 'mic', 'bacteria', 'bacterial',
-                'staphylococcus', 'aureus', 'coli', 'pseudomonas', 'hemolysis',
-                'sequence', 'mechanism', 'toxicity', 'gram-positive', 'gram-negative',
-                '抗菌肽', '细菌', '序列', '机理'
-            ]
-            if not any(keyword in question_lower for keyword in amp_keywords):
-                return False
-
-        # AMP-related keywords
-        amp_keywords = [
-            'antimicrobial', 'peptide', 'amp', 'mic', 'bacteria', 'bacterial',
-            'staphylococcus', 'aureus', 'coli', 'pseudomonas', 'hemolysis',
-            'sequence', 'mechanism', 'toxicity', 'gram-positive', 'gram-negative',
-            'nisin', 'lysozyme', 'defensin', 'magainin', 'cecropin',
-            '抗菌肽', '细菌', '序列', '机理'
-        ]
-
-        # If contains AMP keywords, it's likely AMP-related
-        if any(keyword in question_lower for keyword in amp_keywords):
+        # Exception: if it also contains AMP keywords, it might be AMP-related
+        if km.has_any(hits, "non_amp") and not km.has_any(hits, "amp_core"):
+            return False
+
+        # Follow-ups in an ongoing AMP conversation inherit its topic ("what about its hemolysis?")
+        if follow_up:
+            return True
+
+        # If contains AMP keywords (including known peptide names), it's likely AMP-related
+        if km.has_any(hits, "amp_core") or km.has_any(hits, "amp_names"):
             return True
 
         # For longer questions, be more conservative - only assume AMP-related if it's very likely
-        if len(question.strip()) > 15:
-            # Look for scientific/biological context that might be AMP-related
-            bio_indicators = ['protein', 'amino acid', 'bioactive', 'therapeutic', 'antibiotic']
-            if any(indicator in question_lower for indicator in bio_indicators):
-                return True
+        # Look for scientific/biological context that might be AMP-related
+        if len(question.strip()) > 15 and km.has_any(hits, "bio"):
+            return True
 
         return False
 
-    def query(self, question: str) -> str:
-        """Process a single query and return the answer"""
+    @staticmethod
+    def _doc_key(doc):
+        return (doc.get("shard"), doc.get("source"), doc.get("chunk_id"))
+
+    def _session_state(self, question: str, shards: list, conversation_id: str):
+        """Previous turn's state if this question is a follow-up in the same conversation (no new subject)."""
+        state = self.sessions.get(conversation_id)
+        # Only a turn that resolved a microbe gives later questions a subject to inherit
+        if state is None or state.shards != shards or not state.microbe_terms:
+            return None
+        terms = self.retriever.extract_microbe_terms(question)
+        if not set(terms) <= set(state.microbe_terms):
+            return None  # new subject: cold retrieval
+        km = self.keyword_matcher
+        if km.has_any(km.match(question), "amp_names"):
+            return None  # names its own peptide: new subject
+        return state
+
+    def _retrieve_context(self, question: str, shards: list = None, conversation_id: str = None, state=None):
+        """Retrieve and pack context for a question; returns (context_docs, question_for_prompt).
+
+        Follow-ups reuse the previous turn's microbe terms and packed context: a single un-expanded search
+        on the resolved question either hits the context we already have, or prepends the newly hit paper.
+        """
+        if state is None:
+            terms = self.retriever.extract_microbe_terms(question)
+            relevant_docs = self.retriever.retrieve(question, shards=shards, terms=terms)
+            full_docs = self._expand_to_full_document(relevant_docs)
+            prompt_question = question
+        else:
+            terms = state.microbe_terms
+            resolved = " ".join(terms[:2] + [question])
+            relevant_docs = self.retriever.retrieve(resolved, shards=shards, terms=terms, expand=False)
+            known = {self._doc_key(d) for d in state.context_docs}
+            if relevant_docs and self._doc_key(relevant_docs[0]) not in known:
+                new_docs = self._expand_to_full_document(relevant_docs)
+            else:
+                new_docs = []
+            if new_docs:
+                # Newly hit paper first, then the previous turn's primary paper (at most two papers in context)
+                new_sources = {(d.get("shard"), d.get("source")) for d in new_docs}
+                prev_primary = (state.context_docs[0].get("shard"), state.context_docs[0].get("source")) if state.context_docs else None
+                full_docs = new_docs + [d for d in state.context_docs
+                                        if (d.get("shard"), d.get("source")) == prev_primary and prev_primary not in new_sources]
+            else:
+                full_docs = state.context_docs
+            prompt_question = f"{question} (regarding {', '.join(terms[:2])})" if terms else question
+
+        self.sessions.put(conversation_id, ConversationState(
+            microbe_terms=terms,
+            context_docs=full_docs,
+            shards=shards,
+        ))
+        return full_docs, prompt_question
+
+    def query(self, question: str, shards: list = None, conversation_id: str = None) -> str:
+        """Process a single query and return the answer (optionally restricted to a subset of shards)"""
+        state = self._session_state(question, shards, conversation_id)
         # Check if this is an AMP-related query
-        if not self._is_amp_related_query(question):
+        if not self._is_amp_related_query(question, follow_up=state is not None):
             return "Hello! I'm an AI assistant specialized in antimicrobial peptide research. Please ask me questions about antimicrobial peptides, their sequences, MIC values, mechanisms of action, or related topics."
 
-        relevant_docs = self.retriever.retrieve(question)
-        full_docs = self._expand_to_full_document(relevant_docs)
-        response = self.generator.generate(question, full_docs)
+        # Don't spend encoder/search capacity on a request the LLM gate would reject anyway
+        self._precheck(self.llm_gate)
+        with self._admit(self.search_gate):
+            full_docs, prompt_question = self._retrieve_context(question, shards, conversation_id, state)
+        with self._admit(self.llm_gate):
+            response = self.generator.generate(prompt_question, full_docs)
         return response
 
-    def stream_query(self, question: str):
-        """Stream answer generation, word by word output"""
+    def stream_query(self, question: str, shards: list = None, conversation_id: str = None, cancel=None):
+        """Stream answer generation, word by word output (optionally restricted to a subset of shards).
+        `cancel` (models.dispatch.CancelToken) aborts the upstream LLM request, e.g. when the client disconnects."""
+        state = self._session_state(question, shards, conversation_id)
         # Check if this is an AMP-related query
-        if not self._is_amp_related_query(question):
+        if not self._is_amp_related_query(question, follow_up=state is not None):
             greeting_response = "Hello! I'm an AI assistant specialized in antimicrobial peptide research. Please ask me questions about antimicrobial peptides, their sequences, MIC values, mechanisms of action, or related topics."
             for char in greeting_response:
                 yield char
             return
 
-        relevant_docs = self.retriever.retrieve(question)
-        full_docs = self._expand_to_full_document(relevant_docs)
+        # Don't spend encoder/search capacity on a request the LLM gate would reject anyway
+        self._precheck(self.llm_gate)
+        with self._admit(self.search_gate):
+            full_docs, prompt_question = self._retrieve_context(question, shards, conversation_id, state)
         from generation.prompt import PromptBuilder
         # Prepend source list so the model can cite actual filenames
         import os as _os
@@ -146,36 +194,17 @@ class AntimicrobialRAG:
         _sources_line = f"Sources: {'; '.join(_sources)}" if _sources else ""
         _context_body = "\n\n".join([doc["text"] for doc in full_docs])
         context = "\n\n".join([p for p in [_sources_line, _context_body] if p])
-        prompt = PromptBuilder.build_rag_prompt_amp_answer(question, context)
-        from my_config import config
-        import requests
-        url = config.DEEPSEEK_API_URL
-        headers = {
-            "Authorization": f"Bearer {config.DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.2,
-            "max_tokens": 800,
-            "top_p": 0.9,
-            "stream": True
-        }
-        with requests.post(url, headers=headers, json=payload, stream=True, timeout=60) as r:
-            for line in r.iter_lines(decode_unicode=True):
-                if line and line.startswith('data: '):
-                    data = line[6:]
-                    if data == '[DONE]':
-                        break
-                    import json as _json
-                    try:
-                        delta = _json.loads(data)
-                        content = delta["choices"][0]["delta"].get("content", "")
-                        if content:
-                            yield content
-                    except Exception:
-                        continue
+        prompt = PromptBuilder.build_rag_prompt_amp_answer(prompt_question, context)
+        # Hedged/failover dispatch: no more waiting indefinitely on one slow first token
+        dispatcher = get_llm_dispatcher()
+        with self._admit(self.llm_gate):
+            yield from dispatcher.stream(
+                [{"role": "user", "content": prompt}],
+                cancel=cancel,
+                temperature=0.2,
+                max_tokens=800,
+                top_p=0.9,
+            )
 
     def chat(self):
         print("Antimicrobial Peptide Q&A System started. Type 'quit' or 'exit' to end conversation.")
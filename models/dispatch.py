@@ -0,0 +1,306 @@
+import json
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+import requests
+from my_config import config
+
+
+class LLMRequestError(Exception):
+    """The endpoint rejected the request itself (4xx other than 408/429); another endpoint would too."""
+
+
+class CancelToken:
+    """Cross-thread cancellation signal; callbacks run once, immediately if already cancelled."""
+
+    def __init__(self):
+        self._cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def add_callback(self, fn) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn()
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: opens after N consecutive failures, lets one probe through after the cooldown."""
+
+    def __init__(self, max_failures: int, cooldown: float):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown and not self._probing:
+                self._probing = True  # half-open: a single trial request
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Attempt ended without a verdict (e.g. cancelled as a hedge loser)."""
+        with self._lock:
+            self._probing = False
+
+
+class _Attempt:
+    """One streaming request to one endpoint, read on a background thread into the shared event queue."""
+
+    def __init__(self, attempt_id: int, endpoint: Dict, payload: Dict, events: "queue.Queue", timeout: float):
+        self.id = attempt_id
+        self.endpoint = endpoint
+        self.payload = dict(payload, model=endpoint.get("model", payload.get("model")), stream=True)
+        self.events = events
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+        self.response = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        headers = {
+            "Authorization": f"Bearer {self.endpoint.get('api_key', '')}",
+            "Content-Type": "application/json"
+        }
+        try:
+            self.response = requests.post(self.endpoint["url"], headers=headers, json=self.payload,
+                                          stream=True, timeout=self.timeout)
+            if self.cancelled.is_set():
+                self.response.close()
+                return
+            with self.response as r:
+                if 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+                    self.events.put((self.id, "rejected", LLMRequestError(
+                        f"{r.status_code} from {self.endpoint['url']}: {r.text[:500]}")))
+                    return
+                r.raise_for_status()
+                for line in r.iter_lines(decode_unicode=True):
+                    if self.cancelled.is_set():
+                        return
+                    if not line or not line.startswith('data: '):
+                        continue
+                    data = line[6:]
+                    if data == '[DONE]':
+                        break
+                    try:
+                        content = json.loads(data)["choices"][0]["delta"].get("content", "")
+                    except Exception:
+                        continue
+                    if content:
+                        self.events.put((self.id, "token", content))
+            self.events.put((self.id, "done", None))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.events.put((self.id, "error", e))
+
+    def cancel(self):
+        self.cancelled.set()
+        response = self.response
+        if response is None:
+            return
+        # close() would wait on the reader thread's buffer lock; shutting the socket down
+        # unblocks that read immediately (urllib3 >= 2.3), otherwise close in the background
+        shutdown = getattr(response.raw, "shutdown", None)
+        try:
+            if shutdown is not None:
+                shutdown()
+            else:
+                threading.Thread(target=response.close, daemon=True).start()
+        except Exception:
+            pass
+
+
+class LLMDispatcher:
+    """Dispatch chat completions over an ordered list of OpenAI-compatible endpoints.
+
+    If no first token arrives within `first_token_deadline` seconds a hedged duplicate is sent to the
+    next healthy endpoint; whichever attempt yields a token first is streamed and the others are
+    cancelled. Attempts that fail before their first token fail over immediately, and endpoints that
+    keep failing (or stay silent past the deadline) are skipped by a circuit breaker until their cooldown
+    expires. Client errors (4xx other than 408/429) are raised as LLMRequestError without failover.
+    """
+
+    def __init__(self, endpoints: List[Dict] = None, first_token_deadline: float = None,
+                 max_hedges: int = None, request_timeout: float = None,
+                 breaker_failures: int = None, breaker_cooldown: float = None):
+        if endpoints is None:
+            endpoints = config.LLM_ENDPOINTS or [{
+                "url": config.DEEPSEEK_API_URL,
+                "api_key": config.DEEPSEEK_API_KEY,
+                "model": "deepseek-chat",
+            }]
+        self.endpoints = list(endpoints)
+        self.first_token_deadline = first_token_deadline if first_token_deadline is not None else config.LLM_FIRST_TOKEN_DEADLINE
+        self.max_hedges = max_hedges if max_hedges is not None else config.LLM_MAX_HEDGES
+        self.request_timeout = request_timeout if request_timeout is not None else config.LLM_REQUEST_TIMEOUT
+        failures = breaker_failures if breaker_failures is not None else config.LLM_BREAKER_FAILURES
+        cooldown = breaker_cooldown if breaker_cooldown is not None else config.LLM_BREAKER_COOLDOWN
+        self.breakers = [CircuitBreaker(failures, cooldown) for _ in self.endpoints]
+
+    def _pick_endpoint(self, start: int, skip=()) -> Optional[int]:
+        """Next endpoint index (round-robin from start, not in skip) whose breaker admits a request."""
+        n = len(self.endpoints)
+        for i in range(n):
+            idx = (start + i) % n
+            if idx not in skip and self.breakers[idx].allow():
+                return idx
+        return None
+
+    def stream(self, messages: List[Dict], cancel: CancelToken = None, **params) -> Iterator[str]:
+        """Yield content deltas from the first endpoint to respond; cancels the losers (and everything on close
+        or when `cancel` fires, e.g. after a client disconnect)."""
+        payload = {"messages": messages, **params}
+        events: "queue.Queue" = queue.Queue()
+        if cancel is not None:
+            # Attempt ids start at 1; id 0 wakes the wait loops below
+            cancel.add_callback(lambda: events.put((0, "cancel", None)))
+        attempts: Dict[int, tuple] = {}  # attempt id -> (endpoint index, _Attempt)
+        hedges_left = self.max_hedges
+        cursor = 0
+        next_id = 0
+        winner = None
+        last_error: Optional[Exception] = None
+        failed = set()  # endpoints that already failed this request; failover never resends to them
+
+        def launch() -> bool:
+            nonlocal cursor, next_id
+            idx = self._pick_endpoint(cursor, failed)
+            if idx is None:
+                return False
+            cursor = idx + 1
+            next_id += 1
+            attempts[next_id] = (idx, _Attempt(next_id, self.endpoints[idx], payload, events, self.request_timeout))
+            return True
+
+        try:
+            if not launch():
+                raise RuntimeError("All LLM endpoints are unavailable (circuit open)")
+            started = time.monotonic()
+            deadline = started + self.first_token_deadline
+            while winner is None:
+                try:
+                    attempt_id, kind, value = events.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    now = time.monotonic()
+                    if now - started >= self.request_timeout:
+                        # Endpoints that never produced a first token count as failing, so the breaker skips them
+                        for _, attempt in attempts.values():
+                            attempt.cancel()
+                        for idx in {idx for idx, _ in attempts.values()}:
+                            self.breakers[idx].record_failure()
+                        attempts.clear()
+                        raise TimeoutError(f"No first token from any LLM endpoint within {self.request_timeout}s")
+                    # First-token deadline passed: fire a hedged duplicate if allowed
+                    if hedges_left > 0 and launch():
+                        hedges_left -= 1
+                    deadline = min(now + self.first_token_deadline, started + self.request_timeout)
+                    continue
+                if kind == "cancel":
+                    return
+                if attempt_id not in attempts:
+                    continue
+                idx, attempt = attempts[attempt_id]
+                if kind == "rejected":
+                    # The request itself is bad (e.g. context too long): no breaker verdict, no failover
+                    self.breakers[idx].release()
+                    del attempts[attempt_id]
+                    raise value
+                if kind == "error":
+                    last_error = value
+                    self.breakers[idx].record_failure()
+                    failed.add(idx)
+                    del attempts[attempt_id]
+                    # Fail over right away; give up only when nothing is in flight and nothing is left to try
+                    if not launch() and not attempts:
+                        raise RuntimeError(f"All LLM endpoints failed: {last_error}")
+                    continue
+                winner = attempt_id
+                self.breakers[idx].record_success()
+                for other_id, (other_idx, other) in list(attempts.items()):
+                    if other_id != winner:
+                        other.cancel()
+                        # Launched before the winner and still no first token: that endpoint is the slow one
+                        if other_id < winner and other_idx != idx:
+                            self.breakers[other_idx].record_failure()
+                        else:
+                            self.breakers[other_idx].release()
+                        del attempts[other_id]
+                if kind == "done" or (cancel is not None and cancel.cancelled):
+                    return
+                yield value
+
+            idx, attempt = attempts[winner]
+            while True:
+                try:
+                    attempt_id, kind, value = events.get(timeout=self.request_timeout)
+                except queue.Empty:
+                    self.breakers[idx].record_failure()
+                    raise TimeoutError(f"LLM stream stalled: no data from the endpoint within {self.request_timeout}s")
+                if kind == "cancel":
+                    return
+                if attempt_id != winner:
+                    continue
+                if kind == "token":
+                    # A cancel event queues behind tokens already received; don't keep yielding those
+                    if cancel is not None and cancel.cancelled:
+                        return
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    self.breakers[idx].record_failure()
+                    raise RuntimeError(f"LLM stream interrupted: {value}")
+        finally:
+            for attempt_id, (idx, attempt) in attempts.items():
+                attempt.cancel()
+                if attempt_id != winner:
+                    self.breakers[idx].release()
+
+    def generate(self, messages: List[Dict], **params) -> str:
+        """Non-streaming completion built on stream(), so it gets the same hedging and failover."""
+        return "".join(self.stream(messages, **params))
+
+
+_default_dispatcher = None
+def get_llm_dispatcher() -> LLMDispatcher:
+    """Shared dispatcher over config.LLM_ENDPOINTS, so breaker state is kept per process."""
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        _default_dispatcher = LLMDispatcher()
+    return _default_dispatcher
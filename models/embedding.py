@@ -7,15 +7,57 @@ class EmbeddingModel:
     def __init__(self, device=None):  # Add device parameter
         """Initialize embedding model with device support"""
         self.device = device if device else config.DEVICE  # Use device from config by default
+        if self.device == "auto":
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model = SentenceTransformer(
             config.EMBEDDING_MODEL,
             device=self.device  # Pass to SentenceTransformer
         )
 
-    def encode(self, texts: List[str]) -> torch.Tensor:
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        return self.model.max_seq_length
+
+    def encode(self, texts: List[str], batch_size: int = None) -> torch.Tensor:
         """Generate embedding vectors"""
-        return self.model.encode(
-            texts,
-            convert_to_tensor=True,
-            device=self.device  # Ensure using specified device
-        )
\ No newline at end of file
+        batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        if not config.EMBEDDING_LENGTH_BUCKETING or len(texts) <= batch_size:
+            return self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_tensor=True,
+                device=self.device  # Ensure using specified device
+            )
+        return self._encode_bucketed(texts, batch_size)
+
+    def _encode_bucketed(self, texts: List[str], batch_size: int) -> torch.Tensor:
+        """Sort texts by token length into batch-sized buckets (one forward pass each, minimal padding),
+        then restore the original order.
+
+        The extra tokenization pass is only worth it with a fast (Rust) tokenizer: it is then a small
+        fraction of even a CPU forward pass. A slow Python tokenizer can cost as much as the encode
+        itself, so lengths fall back to character counts, like SentenceTransformer's own sorting.
+        """
+        if getattr(self.tokenizer, "is_fast", False):
+            lengths = [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False, truncation=True,
+                                                           max_length=self.max_seq_length)["input_ids"]]
+        else:
+            lengths = [len(t) for t in texts]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        parts = []
+        for start in range(0, len(order), batch_size):
+            bucket = [texts[i] for i in order[start:start + batch_size]]
+            parts.append(self.model.encode(
+                bucket,
+                batch_size=batch_size,
+                convert_to_tensor=True,
+                device=self.device
+            ))
+        embeddings = torch.cat(parts)
+        inverse = torch.empty(len(order), dtype=torch.long)
+        inverse[torch.tensor(order, dtype=torch.long)] = torch.arange(len(order))
+        return embeddings[inverse.to(embeddings.device)]
\ No newline at end of file
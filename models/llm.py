@@ -1,23 +1,15 @@
-import requests
-import json
 from typing import Dict, List
+from models.dispatch import get_llm_dispatcher
 from my_config import config
 
 class DeepSeekAPI:
     def __init__(self):
-        self.api_key = config.DEEPSEEK_API_KEY
-        self.api_url = config.DEEPSEEK_API_URL
+        # Requests go through the shared dispatcher (hedging, failover, circuit breaking over config.LLM_ENDPOINTS)
+        self.dispatcher = get_llm_dispatcher()
 
     def generate(self, prompt: str, **kwargs) -> str:
         """Call DeepSeek API to generate response"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-
-        payload = {
-            "model": "deepseek-chat",  # DeepSeek model name
-            "messages": [{"role": "user", "content": prompt}],
+        params = {
             "temperature": 0.3,  # More stable and faster
             "max_tokens": 512,   # Reduce generation length to lower latency
             "top_p": 0.9,
@@ -25,14 +17,7 @@ class DeepSeekAPI:
         }
 
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                data=json.dumps(payload)
-            )
-            response.raise_for_status()  # Check HTTP errors
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+            return self.dispatcher.generate([{"role": "user", "content": prompt}], **params)
         except Exception as e:
             print(f"DeepSeek API call failed: {e}")
             return "Sorry, an error occurred while generating the response."
\ No newline at end of file
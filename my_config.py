@@ -1,12 +1,20 @@
 from dataclasses import dataclass
-import torch
 
 @dataclass
 class config: 
-    DEVICE: str = "cuda" if torch.cuda.is_available() else "cpu"
+    DEVICE: str = "auto"  # "auto" = cuda if available else cpu (resolved in EmbeddingModel, so config stays torch-free)
 
     DEEPSEEK_API_KEY: str = "..." # Your deepseek API key.
     DEEPSEEK_API_URL: str = "https://api.deepseek.com/v1/chat/completions"
+
+    # Ordered list of OpenAI-compatible chat endpoints, e.g.
+    # [{"url": "...", "api_key": "...", "model": "deepseek-chat"}, ...]; None = DeepSeek only
+    LLM_ENDPOINTS: list = None
+    LLM_FIRST_TOKEN_DEADLINE: float = 4.0  # seconds without a first token before a hedged request
+    LLM_MAX_HEDGES: int = 1
+    LLM_REQUEST_TIMEOUT: float = 60.0
+    LLM_BREAKER_FAILURES: int = 3          # consecutive failures before an endpoint is skipped
+    LLM_BREAKER_COOLDOWN: float = 30.0
     
     EMBEDDING_MODEL: str = "sentence-transformers/all-mpnet-base-v2"
     EMBEDDING_DEVICE: str = "cuda"
@@ -15,6 +23,43 @@ class config:
     MAX_CONTEXT_LENGTH = 20000
     CHUNK_SIZE: int = 500  
     CHUNK_OVERLAP: int = 50
+    CHUNK_MODE: str = "chars"          # "chars" (CHUNK_SIZE characters) or "tokens" (sentence-packed to the encoder window)
+    CHUNK_TOKEN_OVERLAP: int = 32      # token mode: overlap carried as whole trailing sentences
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_LENGTH_BUCKETING: bool = True  # encode in token-length-sorted buckets, original order restored
     TOP_K: int = 3
 
+    # Named corpus shards, e.g. {"papers": "./datasets", "patents": "./patents"}; None = one shard for pdf_folder
+    SHARDS: dict = None
+    INDEX_DIR: str = None            # if set, each shard's index + chunks are saved/loaded under INDEX_DIR/<shard>/
+    SHARD_SEARCH_WORKERS: int = None # thread pool size for fan-out search (default: one per shard)
+
+    # Conversation-aware retrieval reuse for follow-up questions
+    SESSION_CACHE_SIZE: int = 1024   # conversations kept (LRU)
+    SESSION_TTL: float = 1800.0      # seconds of inactivity before a conversation's state expires
+
+    # Admission control for the web serving path (fail fast with 429 when saturated)
+    ADMISSION_SEARCH_CONCURRENCY: int = 2   # concurrent embedding/search (CPU/GPU-bound encoder)
+    ADMISSION_LLM_CONCURRENCY: int = 16     # concurrent LLM streams
+    ADMISSION_QUEUE_SIZE: int = 32          # waiting requests per gate before shedding
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0    # max seconds a request may wait for a slot
+
+    # Out-of-process retrieval service ("unix:/path.sock" or "tcp:host:port"); None = retrieve in-process
+    RETRIEVAL_SERVICE_ADDRESS: str = None
+    RETRIEVAL_SERVICE_BATCH_WINDOW: float = 0.005  # seconds to collect concurrent requests into one encode call
+    RETRIEVAL_SERVICE_MAX_BATCH: int = 32          # max requests per batch
+    RETRIEVAL_SERVICE_TIMEOUT: float = 30.0        # client socket timeout
+
+    # /ask_stream: coalesce LLM deltas into SSE frames by size or time window
+    SSE_COALESCE_WINDOW: float = 0.03  # seconds
+    SSE_MAX_FRAME_CHARS: int = 256
+    SSE_QUEUE_SIZE: int = 256          # buffered deltas before the upstream read is paused (back-pressure)
+
+    # Adaptive sub-query expansion: run the base query first and only add expansion
+    # sub-queries while the top-k is below the score / keyword-coverage bar
+    ADAPTIVE_EXPANSION: bool = False
+    ADAPTIVE_MIN_SCORE: float = 0.6      # every top-k hit needs base_score >= this
+    ADAPTIVE_MIN_COVERAGE: float = 1.0   # fraction of query microbe terms found in the top-k
+    ADAPTIVE_EXPANSION_STEP: int = 2     # expansion sub-queries encoded per escalation step
+
 config = config() 
\ No newline at end of file
@@ -0,0 +1,198 @@
+from typing import Dict, Iterable, List, Tuple
+from collections import deque
+import re
+
+# Keyword vocabularies (expandable; all matching is case-insensitive substring matching)
+CASUAL_PATTERNS = [
+    'hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening',
+    'how are you', 'what\'s up', 'thanks', 'thank you', 'bye', 'goodbye',
+    'test', 'testing', '你好', '谢谢', '再见'
+]
+
+NON_AMP_TOPICS = [
+    'machine learning', 'deep learning', 'artificial intelligence', 'ai',
+    'programming', 'python', 'javascript', 'coding', 'software',
+    'weather', 'news', 'politics', 'sports', 'music', 'movie',
+    'recipe', 'cooking', 'travel', 'history', 'geography',
+    'math', 'physics', 'chemistry'  # unless specifically about AMP chemistry
+]
+
+AMP_CORE_KEYWORDS = [
+    'antimicrobial', 'peptide', 'amp', 'mic', 'bacteria', 'bacterial',
+    'staphylococcus', 'aureus', 'coli', 'pseudomonas', 'hemolysis',
+    'sequence', 'mechanism', 'toxicity', 'gram-positive', 'gram-negative',
+    '抗菌肽', '细菌', '序列', '机理'
+]
+
+AMP_PEPTIDE_NAMES = ['nisin', 'lysozyme', 'defensin', 'magainin', 'cecropin']
+
+BIO_INDICATORS = ['protein', 'amino acid', 'bioactive', 'therapeutic', 'antibiotic']
+
+# Common microorganism/genus keywords
+MICROBE_TERMS = [
+    "staphylococcus aureus", "s. aureus", "escherichia coli", "e. coli",
+    "pseudomonas aeruginosa", "klebsiella pneumoniae", "acinetobacter baumannii",
+    "salmonella", "enterococcus faecalis", "enterococcus faecium", "listeria",
+    "bacillus", "mycobacterium", "streptococcus", "gram-positive", "gram-negative",
+]
+
+# Spellings of the same organism; they count as one term when measuring keyword coverage
+MICROBE_SYNONYMS = [
+    ["staphylococcus aureus", "s. aureus"],
+    ["escherichia coli", "e. coli"],
+]
+
+DEFAULT_VOCABULARIES = {
+    "casual": CASUAL_PATTERNS,
+    "non_amp": NON_AMP_TOPICS,
+    "amp_core": AMP_CORE_KEYWORDS,
+    "amp_names": AMP_PEPTIDE_NAMES,
+    "bio": BIO_INDICATORS,
+    "microbe": MICROBE_TERMS,
+}
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over lower-cased patterns; one pass reports every pattern found as a bitmask."""
+
+    def __init__(self, patterns: List[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[int] = [0]
+        for bit, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(0)
+                state = nxt
+            self._out[state] |= 1 << bit
+
+        # Breadth-first construction of failure links; outputs are merged along them
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())  # depth-1 states keep fail = root
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def match(self, text: str) -> int:
+        """Return the bitmask of all patterns occurring in text (text is expected lower-cased)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state, mask = 0, 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            mask |= out[state]
+        return mask
+
+
+class KeywordMatcher:
+    """Single automaton over all keyword vocabularies, with one bit per distinct term."""
+
+    def __init__(self, vocabularies: Dict[str, List[str]] = None, synonyms: List[List[str]] = None):
+        vocabularies = vocabularies if vocabularies is not None else DEFAULT_VOCABULARIES
+        synonyms = synonyms if synonyms is not None else MICROBE_SYNONYMS
+        self.terms: List[str] = []
+        self._bits: Dict[str, int] = {}
+        self._category_masks: Dict[str, int] = {}
+        self._category_terms: Dict[str, List[str]] = {}
+        for name, terms in vocabularies.items():
+            mask = 0
+            self._category_terms[name] = [t.lower() for t in terms]
+            for t in terms:
+                t = t.lower()
+                if t not in self._bits:
+                    self._bits[t] = len(self.terms)
+                    self.terms.append(t)
+                mask |= 1 << self._bits[t]
+            self._category_masks[name] = mask
+        self._synonym_masks: List[int] = []
+        for group in synonyms:
+            mask, _ = self.terms_mask(group)
+            if mask:
+                self._synonym_masks.append(mask)
+        self._automaton = AhoCorasick(self.terms)
+
+    def match(self, text: str) -> int:
+        """Bitmask of all vocabulary terms occurring in text."""
+        return self._automaton.match(text.lower())
+
+    def category_mask(self, name: str) -> int:
+        return self._category_masks.get(name, 0)
+
+    def has_any(self, mask: int, category: str) -> bool:
+        return bool(mask & self._category_masks.get(category, 0))
+
+    def terms_in(self, mask: int, category: str) -> List[str]:
+        """Terms of a category present in mask, in the category's own order."""
+        return [t for t in self._category_terms.get(category, []) if mask >> self._bits[t] & 1]
+
+    def terms_mask(self, terms: Iterable[str]) -> Tuple[int, List[str]]:
+        """Split terms into a bitmask of known vocabulary terms and a list of out-of-vocabulary terms."""
+        mask, unknown = 0, []
+        for t in terms:
+            bit = self._bits.get(t.lower())
+            if bit is None:
+                unknown.append(t)
+            else:
+                mask |= 1 << bit
+        return mask, unknown
+
+    def term_groups(self, mask: int) -> List[int]:
+        """Split a term bitmask into one mask per distinct term, merging synonymous spellings into one group."""
+        groups = []
+        for syn in self._synonym_masks:
+            if mask & syn:
+                groups.append(mask & syn)
+                mask &= ~syn
+        while mask:
+            low = mask & -mask
+            groups.append(low)
+            mask ^= low
+        return groups
+
+    def annotate(self, documents: List[Dict]) -> List[Dict]:
+        """Precompute per-chunk term-hit bitsets (stored under 'term_hits') at ingestion time."""
+        for doc in documents:
+            doc["term_hits"] = self.match(doc.get("text", ""))
+        return documents
+
+
+# Simple genus+species pattern (e.g., "Staphylococcus aureus"), compiled once
+_GENUS_SPECIES_RE = re.compile(r"\b([A-Z][a-z]+\s+[a-z]{3,})\b")
+
+def extract_microbe_terms(text: str, matcher: KeywordMatcher = None) -> List[str]:
+    """Extract target microorganism keywords from text (vocabulary hits, then genus+species pattern), deduplicated."""
+    matcher = matcher if matcher is not None else get_keyword_matcher()
+    hits = matcher.terms_in(matcher.match(text), "microbe")
+    for m in _GENUS_SPECIES_RE.findall(text):
+        hits.append(m.lower())
+    # Deduplicate while preserving order
+    seen, result = set(), []
+    for h in hits:
+        if h not in seen:
+            seen.add(h)
+            result.append(h)
+    return result
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+_default_matcher = None
+def get_keyword_matcher() -> KeywordMatcher:
+    """Shared matcher over the default vocabularies (built once per process)."""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = KeywordMatcher()
+    return _default_matcher
@@ -1,38 +1,29 @@
 from typing import List, Dict
-import re
+import threading
+from collections import Counter
 import numpy as np
 from models.embedding import EmbeddingModel
 from retrieval.vector_db import VectorDB
+from retrieval.keywords import KeywordMatcher, extract_microbe_terms, get_keyword_matcher, popcount
 from my_config import config
 
 class Retriever:
-    def __init__(self, vector_db: VectorDB, embedding_model: EmbeddingModel):
+    def __init__(self, vector_db: VectorDB, embedding_model: EmbeddingModel, keyword_matcher: KeywordMatcher = None):
         self.vector_db = vector_db
         self.embedding_model = embedding_model
+        # Common microorganism/genus keywords live in the shared keyword automaton (retrieval/keywords.py)
+        self.keyword_matcher = keyword_matcher if keyword_matcher is not None else get_keyword_matcher()
+        # Sub-queries used per request (see expansion_stats)
+        self._stats_lock = threading.Lock()
+        self.subquery_histogram: Counter = Counter()
+        # Chunks not annotated at ingestion get their term-hit bitsets computed here once
+        unannotated = [d for d in self.vector_db.documents if "term_hits" not in d]
+        if unannotated:
+            self.keyword_matcher.annotate(unannotated)
 
-        # Common microorganism/genus keywords (expandable)
-        self._microbe_terms_seed = [
-            "staphylococcus aureus", "s. aureus", "escherichia coli", "e. coli",
-            "pseudomonas aeruginosa", "klebsiella pneumoniae", "acinetobacter baumannii",
-            "salmonella", "enterococcus faecalis", "enterococcus faecium", "listeria",
-            "bacillus", "mycobacterium", "streptococcus", "gram-positive", "gram-negative",
-        ]
-
-    def _extract_microbe_terms(self, text: str) -> List[str]:
+    def extract_microbe_terms(self, text: str) -> List[str]:
         """Extract target microorganism keywords from query (simple heuristic)."""
-        text_l = text.lower()
-        hits = [t for t in self._microbe_terms_seed if t in text_l]
-        # Simple genus+species pattern (e.g., "Staphylococcus aureus")
-        pat = re.compile(r"\b([A-Z][a-z]+\s+[a-z]{3,})\b")
-        for m in pat.findall(text):
-            hits.append(m.lower())
-        # Deduplicate while preserving order
-        seen, result = set(), []
-        for h in hits:
-            if h not in seen:
-                seen.add(h)
-                result.append(h)
-        return result
+        return extract_microbe_terms(text, self.keyword_matcher)
 
     def _build_expanded_queries(self, base_query: str, terms: List[str]) -> List[str]:
         """Build expanded sub-queries based on microorganism keywords (covering MIC/mechanism/hemolysis evidence)."""
@@ -51,37 +42,150 @@ class Retriever:
                 queries.append(q)
         return queries[:6]
 
+    def _keyword_hits(self, doc: Dict, terms_mask: int, extra_terms: List[str]) -> int:
+        """Count query terms present in a chunk: bitset intersection, plus a substring scan for out-of-vocabulary terms."""
+        chunk_mask = doc.get("term_hits")
+        if chunk_mask is None:
+            chunk_mask = self.keyword_matcher.match(doc.get("text", ""))
+        hit_cnt = popcount(terms_mask & chunk_mask)
+        if extra_terms:
+            text_l = doc.get("text", "").lower()
+            hit_cnt += sum(1 for t in extra_terms if t in text_l)
+        return hit_cnt
+
+    def _covered_terms(self, docs: List[Dict], term_groups: List[int], extra_terms: List[str]) -> int:
+        """Number of distinct query terms (synonymous spellings count once) found anywhere in docs."""
+        terms_mask = 0
+        for g in term_groups:
+            terms_mask |= g
+        covered_mask, covered_extra = 0, set()
+        for d in docs:
+            chunk_mask = d.get("term_hits")
+            if chunk_mask is None:
+                chunk_mask = self.keyword_matcher.match(d.get("text", ""))
+            covered_mask |= chunk_mask & terms_mask
+            if extra_terms:
+                text_l = d.get("text", "").lower()
+                covered_extra.update(t for t in extra_terms if t in text_l)
+        return sum(1 for g in term_groups if covered_mask & g) + len(covered_extra)
+
+    def _is_confident(self, top: List[Dict], k: int, term_groups: List[int], extra_terms: List[str]) -> bool:
+        """Early-exit criteria for adaptive expansion: full top-k above the score bar with enough keyword coverage."""
+        if len(top) < k or any(d["base_score"] < config.ADAPTIVE_MIN_SCORE for d in top):
+            return False
+        n_terms = len(term_groups) + len(extra_terms)
+        if n_terms == 0:
+            return True
+        return self._covered_terms(top, term_groups, extra_terms) / n_terms >= config.ADAPTIVE_MIN_COVERAGE
 
+    def _record_subqueries(self, used: int) -> None:
+        with self._stats_lock:
+            self.subquery_histogram[used] += 1
 
+    def expansion_stats(self) -> Dict:
+        """Sub-queries used per request so far (for tuning retrieval latency against recall)."""
+        with self._stats_lock:
+            total = sum(self.subquery_histogram.values())
+            used = sum(n * c for n, c in self.subquery_histogram.items())
+            return {
+                "requests": total,
+                "mean_subqueries": (used / total) if total else 0.0,
+                "histogram": dict(sorted(self.subquery_histogram.items())),
+            }
 
-    def retrieve(self, query: str, k: int = None) -> List[Dict]:
-        """Keyword-aware retrieval: sub-query expansion and weighted reranking around user-mentioned bacteria/genus."""
+    def source_documents(self, shard: str, source: str) -> List[Dict]:
+        """All chunks of one source document (within a shard when sharded), in chunk order."""
+        shards = getattr(self.vector_db, "shards", None)
+        candidates = shards[shard].documents if shards and shard in shards else self.vector_db.documents
+        docs = [d for d in candidates if d.get("source") == source]
+        docs.sort(key=lambda d: d.get("chunk_id", 0))
+        return docs
+
+    def _plan(self, query: str, k: int = None, adaptive: bool = None, shards: List[str] = None,
+              terms: List[str] = None, expand: bool = True) -> "_RetrievalPlan":
         if k is None:
             k = config.TOP_K
+        if adaptive is None:
+            adaptive = config.ADAPTIVE_EXPANSION
+        if terms is None:
+            terms = self.extract_microbe_terms(query)
+        subqueries = self._build_expanded_queries(query, terms) if expand else [query]
+        return _RetrievalPlan(self, subqueries, terms, k, adaptive, shards)
+
+    def retrieve(self, query: str, k: int = None, adaptive: bool = None, shards: List[str] = None,
+                 terms: List[str] = None, expand: bool = True) -> List[Dict]:
+        """Keyword-aware retrieval: sub-query expansion and weighted reranking around user-mentioned bacteria/genus.
+
+        In adaptive mode the base query runs first, and expansion sub-queries are only added (in steps of
+        config.ADAPTIVE_EXPANSION_STEP) until the top-k meets the score and keyword-coverage criteria.
+        `shards` restricts the search to a subset of named shards (ShardedVectorDB only). `terms` overrides the
+        microbe terms extracted from the query (e.g. carried over from a previous turn); `expand=False` runs
+        the base query only.
+        """
+        return self.retrieve_batch([dict(query=query, k=k, adaptive=adaptive, shards=shards, terms=terms, expand=expand)])[0]
 
-        terms = self._extract_microbe_terms(query)
-        subqueries = self._build_expanded_queries(query, terms)
-        per_query_k = max(k, min(10, k * 2))
+    def retrieve_batch(self, requests: List[Dict]) -> List[List[Dict]]:
+        """Retrieve for several requests (each a dict of retrieve() keyword arguments), encoding the first round
+        of every request's sub-queries in a single encode call."""
+        plans = [self._plan(**r) for r in requests]
+        first_round = [p.subqueries if not p.adaptive else p.subqueries[:1] for p in plans]
+        texts = [q for batch in first_round for q in batch]
+        embs = self.embedding_model.encode(texts).cpu().numpy() if texts else []
+        offset = 0
+        for plan, batch in zip(plans, first_round):
+            plan.absorb(embs[offset:offset + len(batch)])
+            plan.used = len(batch)
+            offset += len(batch)
 
-        merged: Dict[tuple, Dict] = {}
-        alpha = 0.05  # Keyword hit weighting
+        # Adaptive escalation continues per request, only for those below the confidence bar
+        step = max(1, config.ADAPTIVE_EXPANSION_STEP)
+        for plan in plans:
+            while plan.adaptive and plan.used < len(plan.subqueries) and not plan.confident():
+                batch = plan.subqueries[plan.used:plan.used + step]
+                plan.absorb(self.embedding_model.encode(batch).cpu().numpy())
+                plan.used += len(batch)
+            self._record_subqueries(plan.used)
+        return [plan.top() for plan in plans]
 
-        for q in subqueries:
-            emb = self.embedding_model.encode([q]).cpu().numpy()
-            cand = self.vector_db.search(emb, per_query_k)
-            for d in cand:
-                key = (d.get("source"), d.get("chunk_id"))
+
+class _RetrievalPlan:
+    """Per-request retrieval state: sub-queries, keyword masks and the score-merged candidates so far."""
+
+    alpha = 0.05  # Keyword hit weighting
+
+    def __init__(self, retriever: Retriever, subqueries: List[str], terms: List[str], k: int, adaptive: bool,
+                 shards: List[str] = None):
+        self.retriever = retriever
+        self.subqueries = subqueries
+        self.terms = terms
+        self.terms_mask, self.extra_terms = retriever.keyword_matcher.terms_mask(terms)
+        self.term_groups = retriever.keyword_matcher.term_groups(self.terms_mask)
+        self.k = k
+        self.per_query_k = max(k, min(10, k * 2))
+        self.adaptive = adaptive
+        self.search_kwargs = {"shards": shards} if shards else {}
+        self.merged: Dict[tuple, Dict] = {}
+        self.used = 0  # sub-queries searched so far for this request
+
+    def absorb(self, embs) -> None:
+        """Search each sub-query embedding and merge candidates, keeping each chunk's best boosted score."""
+        for emb in embs:
+            for d in self.retriever.vector_db.search(emb, self.per_query_k, **self.search_kwargs):
+                key = (d.get("shard"), d.get("source"), d.get("chunk_id"))
                 base_score = float(d.get("score", 0.0))
-                text_l = d.get("text", "").lower()
-                hit_cnt = sum(1 for t in terms if t in text_l)
-                boosted = base_score + alpha * hit_cnt
-                prev = merged.get(key)
-                if (prev is None) or (boosted > prev["score"]):
-                    dd = dict(d)
-                    dd["base_score"] = base_score
-                    dd["score"] = boosted
-                    dd["keyword_hits"] = hit_cnt
-                    merged[key] = dd
-
-        results = sorted(merged.values(), key=lambda x: x["score"], reverse=True)
-        return results[:k]
+                prev = self.merged.get(key)
+                if prev is not None and base_score + self.alpha * prev["keyword_hits"] <= prev["score"]:
+                    continue
+                hit_cnt = prev["keyword_hits"] if prev is not None else \
+                    self.retriever._keyword_hits(d, self.terms_mask, self.extra_terms)
+                dd = dict(d)
+                dd["base_score"] = base_score
+                dd["score"] = base_score + self.alpha * hit_cnt
+                dd["keyword_hits"] = hit_cnt
+                self.merged[key] = dd
+
+    def top(self) -> List[Dict]:
+        return sorted(self.merged.values(), key=lambda x: x["score"], reverse=True)[:self.k]
+
+    def confident(self) -> bool:
+        return self.retriever._is_confident(self.top(), self.k, self.term_groups, self.extra_terms)
@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from my_config import config
+
+
+@dataclass
+class ConversationState:
+    """What the previous turn resolved: its microbe terms and packed context."""
+    microbe_terms: List[str]
+    context_docs: List[Dict]
+    shards: Optional[List[str]] = None
+    updated_at: float = field(default_factory=time.monotonic)
+
+
+class ConversationCache:
+    """Thread-safe LRU of ConversationState keyed by conversation id, with idle expiry."""
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = max_size if max_size is not None else config.SESSION_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else config.SESSION_TTL
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: Optional[str]) -> Optional[ConversationState]:
+        if not conversation_id:
+            return None
+        with self._lock:
+            state = self._states.get(conversation_id)
+            if state is None:
+                return None
+            if time.monotonic() - state.updated_at > self.ttl:
+                del self._states[conversation_id]
+                return None
+            self._states.move_to_end(conversation_id)
+            return state
+
+    def put(self, conversation_id: Optional[str], state: ConversationState) -> None:
+        if not conversation_id:
+            return
+        state.updated_at = time.monotonic()
+        with self._lock:
+            self._states[conversation_id] = state
+            self._states.move_to_end(conversation_id)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+
+    def drop(self, conversation_id: Optional[str]) -> None:
+        with self._lock:
+            self._states.pop(conversation_id, None)
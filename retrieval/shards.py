@@ -0,0 +1,129 @@
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import faiss
+import numpy as np
+from data_processing.pdf_loader import PDFLoader
+from data_processing.text_chunker import TextChunker
+from models.embedding import EmbeddingModel
+from retrieval.keywords import KeywordMatcher
+from retrieval.vector_db import VectorDB
+from my_config import config
+
+
+class Shard:
+    """One named collection (e.g. papers, patents, lab reports) with its own index and chunk store."""
+
+    def __init__(self, name: str, pdf_folder: str):
+        self.name = name
+        self.pdf_folder = pdf_folder
+        self.vector_db: Optional[VectorDB] = None
+
+    @property
+    def documents(self) -> List[dict]:
+        return self.vector_db.documents if self.vector_db is not None else []
+
+    def build(self, embedding_model: EmbeddingModel, keyword_matcher: KeywordMatcher) -> "Shard":
+        """Load PDFs, chunk, annotate keyword hits, encode and index this shard's collection."""
+        documents = PDFLoader(self.pdf_folder).load_pdfs()
+        chunker = TextChunker(tokenizer=embedding_model.tokenizer, max_tokens=embedding_model.max_seq_length)
+        chunked = chunker.chunk_documents(documents)
+        for doc in chunked:
+            doc["shard"] = self.name
+        keyword_matcher.annotate(chunked)
+
+        embeddings = embedding_model.encode([doc["text"] for doc in chunked]).cpu().numpy()
+        if embeddings.dtype != np.float32:
+            embeddings = embeddings.astype(np.float32)
+        self.vector_db = VectorDB(embeddings.shape[1])
+        self.vector_db.add_documents(embeddings, chunked)
+        return self
+
+    def save(self, index_dir: str) -> None:
+        """Persist index and chunk store under index_dir/<name>/."""
+        path = os.path.join(index_dir, self.name)
+        os.makedirs(path, exist_ok=True)
+        self.vector_db.persist_index(os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "documents.pkl"), "wb") as f:
+            pickle.dump(self.vector_db.documents, f)
+
+    def load(self, index_dir: str, keyword_matcher: KeywordMatcher = None) -> bool:
+        """Load a previously saved index; returns False if this shard has not been built yet.
+
+        Saved term-hit bitsets depend on the vocabulary order in retrieval/keywords.py, so with a
+        keyword_matcher they are recomputed against the current vocabularies.
+        """
+        path = os.path.join(index_dir, self.name)
+        index_path = os.path.join(path, "index.faiss")
+        docs_path = os.path.join(path, "documents.pkl")
+        if not (os.path.exists(index_path) and os.path.exists(docs_path)):
+            return False
+        index = faiss.read_index(index_path)
+        with open(docs_path, "rb") as f:
+            documents = pickle.load(f)
+        if keyword_matcher is not None:
+            keyword_matcher.annotate(documents)
+        self.vector_db = VectorDB(index.d, index=index, documents=documents)
+        return True
+
+
+def load_or_build_shards(shard_folders: Dict[str, str], embedding_model: EmbeddingModel,
+                         keyword_matcher: KeywordMatcher) -> List[Shard]:
+    """Load each shard from config.INDEX_DIR when present, otherwise build it (and save it if INDEX_DIR is set)."""
+    shards = []
+    for name, folder in shard_folders.items():
+        shard = Shard(name, folder)
+        if not (config.INDEX_DIR and shard.load(config.INDEX_DIR, keyword_matcher)):
+            shard.build(embedding_model, keyword_matcher)
+            if config.INDEX_DIR:
+                shard.save(config.INDEX_DIR)
+        shards.append(shard)
+    return shards
+
+
+class ShardedVectorDB:
+    """VectorDB-compatible facade over named shards: searches fan out on a thread pool and merge by score."""
+
+    def __init__(self, shards: List[Shard], max_workers: int = None):
+        self.shards: Dict[str, Shard] = {s.name: s for s in shards}
+        workers = max_workers or config.SHARD_SEARCH_WORKERS or len(self.shards) or 1
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search")
+
+    @property
+    def documents(self) -> List[dict]:
+        docs: List[dict] = []
+        for shard in self.shards.values():
+            docs.extend(shard.documents)
+        return docs
+
+    def _select(self, names: Optional[List[str]]) -> List[Shard]:
+        if not names:
+            selected = list(self.shards.values())
+        else:
+            unknown = [n for n in names if n not in self.shards]
+            if unknown:
+                raise ValueError(f"Unknown shard(s): {', '.join(unknown)}")
+            selected = [self.shards[n] for n in names]
+        return [s for s in selected if s.vector_db is not None]
+
+    def search(self, query_embedding: np.ndarray, k: int = 3, shards: Optional[List[str]] = None) -> List[dict]:
+        """Search the selected shards in parallel (FAISS releases the GIL) and merge by score, with the same
+        threshold + fallback behaviour as VectorDB.search."""
+        selected = self._select(shards)
+        if not selected:
+            return []
+        if len(selected) == 1:
+            return selected[0].vector_db.search(query_embedding, k)
+
+        futures = [self._pool.submit(s.vector_db.search, query_embedding, k) for s in selected]
+        results: List[dict] = []
+        for fut in futures:
+            results.extend(fut.result())
+        results.sort(key=lambda x: x["score"], reverse=True)
+
+        # Per-shard fallbacks may contain below-threshold hits; drop them if any shard cleared the threshold
+        above = [d for d in results if d["score"] >= config.SIMILARITY_THRESHOLD]
+        if above:
+            return above[:k]
+        return results[:min(k, 3)]
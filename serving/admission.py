@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+
+class Overloaded(Exception):
+    """Raised when a gate is saturated; carries a Retry-After hint in seconds."""
+
+    def __init__(self, gate: str, retry_after: int):
+        super().__init__(f"{gate} is overloaded, retry after {retry_after}s")
+        self.gate = gate
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Bounded concurrency with a bounded, deadline-limited wait queue; fails fast when saturated."""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float, window: int = 1024):
+        if max_concurrent < 1:
+            raise ValueError(f"{name}: max_concurrent must be >= 1, got {max_concurrent}")
+        if max_queue < 0:
+            raise ValueError(f"{name}: max_queue must be >= 0, got {max_queue}")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._max_waiting_seen = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._waits = deque(maxlen=window)  # recent queue wait times (s)
+        self._holds = deque(maxlen=window)  # recent slot hold times (s)
+
+    def _retry_after(self) -> int:
+        """Rough time until a queued request would get a slot: mean hold time x queue position / concurrency."""
+        mean_hold = (sum(self._holds) / len(self._holds)) if self._holds else 1.0
+        return max(1, math.ceil(mean_hold * (self._waiting + 1) / self.max_concurrent))
+
+    def check(self) -> None:
+        """Fail fast without taking a slot: raise Overloaded if acquire() would be rejected right now."""
+        with self._cond:
+            if self._active >= self.max_concurrent and self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise Overloaded(self.name, self._retry_after())
+
+    def acquire(self) -> float:
+        """Take a slot, waiting at most queue_timeout in the queue; returns the time spent waiting."""
+        start = time.monotonic()
+        with self._cond:
+            if self._active < self.max_concurrent and self._waiting == 0:
+                self._active += 1
+                self._admitted += 1
+                self._waits.append(0.0)
+                return 0.0
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise Overloaded(self.name, self._retry_after())
+            self._waiting += 1
+            self._max_waiting_seen = max(self._max_waiting_seen, self._waiting)
+            try:
+                deadline = start + self.queue_timeout
+                while self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise Overloaded(self.name, self._retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            self._admitted += 1
+            waited = time.monotonic() - start
+            self._waits.append(waited)
+            return waited
+
+    def release(self, held: float = None) -> None:
+        with self._cond:
+            self._active -= 1
+            if held is not None:
+                self._holds.append(held)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            waits = sorted(self._waits)
+            n = len(waits)
+            return {
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "max_queue_depth_seen": self._max_waiting_seen,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "wait_mean_ms": round(1000 * sum(waits) / n, 2) if n else 0.0,
+                "wait_p50_ms": round(1000 * waits[n // 2], 2) if n else 0.0,
+                "wait_p95_ms": round(1000 * waits[min(n - 1, int(n * 0.95))], 2) if n else 0.0,
+                "wait_max_ms": round(1000 * waits[-1], 2) if n else 0.0,
+            }
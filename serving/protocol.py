@@ -0,0 +1,110 @@
+import json
+import math
+import socket
+import struct
+from typing import Dict, List, Tuple
+
+# Compact framing for the retrieval service: [u32 payload length][u8 opcode][payload]
+OP_RETRIEVE_BATCH = 0x01  # payload: JSON list of retrieve() keyword-argument dicts
+OP_SOURCE_DOCS = 0x02     # payload: JSON {"shard": ..., "source": ...}
+OP_STATS = 0x03           # payload: empty
+OP_DOCS = 0x81            # payload: binary document lists (see encode_doc_lists)
+OP_JSON = 0x82            # payload: JSON value
+OP_ERROR = 0x83           # payload: UTF-8 error message
+
+_FRAME = struct.Struct(">IB")
+# Per document: score, base_score (f32, NaN = absent), keyword_hits (i16, -1 = absent), chunk_id (i32, -1 = absent),
+# then byte lengths of shard, source and text, followed by the three UTF-8 strings
+_DOC = struct.Struct(">ffhiHHI")
+_COUNT = struct.Struct(">H")
+
+MAX_FRAME = 64 * 1024 * 1024
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """'unix:/path/to.sock' or 'tcp:host:port' -> (socket family, address)."""
+    kind, _, rest = address.partition(":")
+    if kind == "unix":
+        return socket.AF_UNIX, rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(f"Unsupported retrieval service address: {address}")
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, op: int, payload: bytes = b"") -> None:
+    sock.sendall(_FRAME.pack(len(payload), op) + payload)
+
+
+def recv_frame(sock: socket.socket) -> Tuple[int, bytes]:
+    length, op = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame too large: {length} bytes")
+    return op, _recv_exact(sock, length) if length else b""
+
+
+def encode_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_json(payload: bytes):
+    return json.loads(payload.decode("utf-8"))
+
+
+def encode_doc_lists(doc_lists: List[List[Dict]]) -> bytes:
+    """Binary encoding of lists of retrieved chunks (only the fields the RAG pipeline uses)."""
+    parts = [_COUNT.pack(len(doc_lists))]
+    for docs in doc_lists:
+        parts.append(_COUNT.pack(len(docs)))
+        for d in docs:
+            shard = (d.get("shard") or "").encode("utf-8")
+            source = (d.get("source") or "").encode("utf-8")
+            text = d.get("text", "").encode("utf-8")
+            hits = d.get("keyword_hits")
+            chunk_id = d.get("chunk_id")
+            parts.append(_DOC.pack(
+                float(d["score"]) if "score" in d else math.nan,
+                float(d["base_score"]) if "base_score" in d else math.nan,
+                hits if hits is not None else -1,
+                chunk_id if chunk_id is not None else -1,
+                len(shard), len(source), len(text),
+            ))
+            parts.extend((shard, source, text))
+    return b"".join(parts)
+
+
+def decode_doc_lists(payload: bytes) -> List[List[Dict]]:
+    view = memoryview(payload)
+    (n_lists,), pos = _COUNT.unpack_from(view, 0), _COUNT.size
+    doc_lists = []
+    for _ in range(n_lists):
+        (n_docs,), pos = _COUNT.unpack_from(view, pos), pos + _COUNT.size
+        docs = []
+        for _ in range(n_docs):
+            score, base_score, hits, chunk_id, n_shard, n_source, n_text = _DOC.unpack_from(view, pos)
+            pos += _DOC.size
+            shard = bytes(view[pos:pos + n_shard]).decode("utf-8"); pos += n_shard
+            source = bytes(view[pos:pos + n_source]).decode("utf-8"); pos += n_source
+            text = bytes(view[pos:pos + n_text]).decode("utf-8"); pos += n_text
+            d = {"text": text, "source": source or None, "shard": shard or None}
+            if chunk_id >= 0:
+                d["chunk_id"] = chunk_id
+            if not math.isnan(score):
+                d["score"] = score
+            if not math.isnan(base_score):
+                d["base_score"] = base_score
+            if hits >= 0:
+                d["keyword_hits"] = hits
+            docs.append(d)
+        doc_lists.append(docs)
+    return doc_lists
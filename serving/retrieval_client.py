@@ -0,0 +1,102 @@
+import socket
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from my_config import config
+from retrieval.keywords import KeywordMatcher, extract_microbe_terms, get_keyword_matcher
+from serving import protocol
+
+
+class RetrievalClient:
+    """Thin, Retriever-compatible client for serving.retrieval_service (no torch, model or index in-process).
+
+    Keeps one connection per thread; microbe term extraction stays local since it only needs the keyword automaton.
+    """
+
+    def __init__(self, address: str, keyword_matcher: KeywordMatcher = None, timeout: float = None,
+                 source_cache_size: int = 32):
+        self.address = address
+        self.family, self.sock_addr = protocol.parse_address(address)
+        self.keyword_matcher = keyword_matcher if keyword_matcher is not None else get_keyword_matcher()
+        self.timeout = timeout if timeout is not None else config.RETRIEVAL_SERVICE_TIMEOUT
+        self._local = threading.local()
+        # Full source documents are immutable for the lifetime of the service; keep a few recent ones
+        self._source_cache: "OrderedDict[tuple, List[Dict]]" = OrderedDict()
+        self._source_cache_size = source_cache_size
+        self._cache_lock = threading.Lock()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.sock_addr)
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _call(self, op: int, payload: bytes = b""):
+        # Retry once on a fresh connection when it was refused, reset or broken (e.g. after a service restart);
+        # never on a timeout, which would resend work to an already overloaded service
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                protocol.send_frame(sock, op, payload)
+                reply_op, reply = protocol.recv_frame(sock)
+                break
+            except ConnectionError:
+                self._drop_connection()
+                if attempt:
+                    raise
+            except OSError:
+                self._drop_connection()  # incl. socket.timeout: a late reply would desync this connection
+                raise
+        if reply_op == protocol.OP_ERROR:
+            raise RuntimeError(f"Retrieval service error: {reply.decode('utf-8', 'replace')}")
+        if reply_op == protocol.OP_DOCS:
+            return protocol.decode_doc_lists(reply)
+        return protocol.decode_json(reply)
+
+    def extract_microbe_terms(self, text: str) -> List[str]:
+        return extract_microbe_terms(text, self.keyword_matcher)
+
+    def retrieve(self, query: str, k: int = None, adaptive: bool = None, shards: List[str] = None,
+                 terms: List[str] = None, expand: bool = True) -> List[Dict]:
+        return self.retrieve_batch([dict(query=query, k=k, adaptive=adaptive, shards=shards, terms=terms, expand=expand)])[0]
+
+    def retrieve_batch(self, requests: List[Dict]) -> List[List[Dict]]:
+        # Only send explicit arguments; the service applies its own config defaults
+        payload = [{key: value for key, value in r.items() if value is not None} for r in requests]
+        return self._call(protocol.OP_RETRIEVE_BATCH, protocol.encode_json(payload))
+
+    def source_documents(self, shard: str, source: str) -> List[Dict]:
+        key = (shard, source)
+        with self._cache_lock:
+            if key in self._source_cache:
+                self._source_cache.move_to_end(key)
+                return self._source_cache[key]
+        docs = self._call(protocol.OP_SOURCE_DOCS, protocol.encode_json({"shard": shard, "source": source}))[0]
+        with self._cache_lock:
+            self._source_cache[key] = docs
+            while len(self._source_cache) > self._source_cache_size:
+                self._source_cache.popitem(last=False)
+        return docs
+
+    def expansion_stats(self) -> Dict:
+        """Same shape as Retriever.expansion_stats() (histogram keys restored to ints after JSON)."""
+        stats = self._call(protocol.OP_STATS)["expansion"]
+        stats["histogram"] = {int(n): c for n, c in stats["histogram"].items()}
+        return stats
+
+    def batching_stats(self) -> Dict:
+        """Micro-batching counters of the retrieval service."""
+        return self._call(protocol.OP_STATS)["batching"]
@@ -0,0 +1,186 @@
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+
+from my_config import config
+from serving import protocol
+
+# Keyword arguments a client may pass to Retriever.retrieve
+_RETRIEVE_ARGS = {"query", "k", "adaptive", "shards", "terms", "expand"}
+
+
+class RetrievalService:
+    """Micro-batches retrieve requests from many connections into Retriever.retrieve_batch calls."""
+
+    def __init__(self, retriever, batch_window: float = None, max_batch: int = None):
+        self.retriever = retriever
+        self.batch_window = batch_window if batch_window is not None else config.RETRIEVAL_SERVICE_BATCH_WINDOW
+        self.max_batch = max_batch if max_batch is not None else config.RETRIEVAL_SERVICE_MAX_BATCH
+        self._pending: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        threading.Thread(target=self._batch_loop, daemon=True, name="retrieval-batcher").start()
+
+    def submit(self, requests: List[Dict]) -> Future:
+        for r in requests:
+            unknown = set(r) - _RETRIEVE_ARGS
+            if unknown or "query" not in r:
+                raise ValueError(f"Invalid retrieve request keys: {sorted(unknown) or 'missing query'}")
+        fut: Future = Future()
+        self._pending.put((requests, fut))
+        return fut
+
+    def _batch_loop(self):
+        while True:
+            items = [self._pending.get()]
+            size = len(items[0][0])
+            deadline = time.monotonic() + self.batch_window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            flat = [r for requests, _ in items for r in requests]
+            try:
+                results = self.retriever.retrieve_batch(flat)
+            except Exception:
+                # One bad request (e.g. unknown shard) must not fail its batch-mates: retry each on its own
+                for requests, fut in items:
+                    try:
+                        fut.set_result(self.retriever.retrieve_batch(requests))
+                    except Exception as e:
+                        fut.set_exception(e)
+                continue
+            offset = 0
+            for requests, fut in items:
+                fut.set_result(results[offset:offset + len(requests)])
+                offset += len(requests)
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(flat)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            batching = {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+            }
+        return {"batching": batching, "expansion": self.retriever.expansion_stats()}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One connection: a sequence of request/response frames."""
+
+    def handle(self):
+        service: RetrievalService = self.server.service
+        while True:
+            try:
+                op, payload = protocol.recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                if op == protocol.OP_RETRIEVE_BATCH:
+                    results = service.submit(protocol.decode_json(payload)).result()
+                    protocol.send_frame(self.request, protocol.OP_DOCS, protocol.encode_doc_lists(results))
+                elif op == protocol.OP_SOURCE_DOCS:
+                    args = protocol.decode_json(payload)
+                    docs = service.retriever.source_documents(args.get("shard"), args["source"])
+                    protocol.send_frame(self.request, protocol.OP_DOCS, protocol.encode_doc_lists([docs]))
+                elif op == protocol.OP_STATS:
+                    protocol.send_frame(self.request, protocol.OP_JSON, protocol.encode_json(service.stats()))
+                else:
+                    raise ValueError(f"Unknown opcode: {op}")
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                try:
+                    protocol.send_frame(self.request, protocol.OP_ERROR, str(e).encode("utf-8"))
+                except OSError:
+                    return
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Unlink a Unix socket left behind by a previous run; refuse to touch anything else."""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{path} exists and is not a socket; refusing to replace it")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)  # nobody listening: stale
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"{path} is in use by a running retrieval service")
+
+
+def make_server(address: str, service: RetrievalService) -> socketserver.BaseServer:
+    family, addr = protocol.parse_address(address)
+    if family == getattr(socket, "AF_UNIX", None):
+        _remove_stale_socket(addr)
+        server = _ThreadingUnixServer(addr, _Handler)
+    else:
+        server = _ThreadingTCPServer(addr, _Handler)
+    server.service = service
+    return server
+
+
+def build_retriever(pdf_folder: str):
+    """Same retrieval stack AntimicrobialRAG builds in-process: encoder, shards (built or loaded) and Retriever."""
+    from models.embedding import EmbeddingModel
+    from retrieval.keywords import get_keyword_matcher
+    from retrieval.retriever import Retriever
+    from retrieval.shards import ShardedVectorDB, load_or_build_shards
+
+    embedding_model = EmbeddingModel()
+    keyword_matcher = get_keyword_matcher()
+    shards = load_or_build_shards(config.SHARDS or {"default": pdf_folder}, embedding_model, keyword_matcher)
+    return Retriever(ShardedVectorDB(shards), embedding_model, keyword_matcher)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standalone retrieval service for AMP-Chat web workers")
+    parser.add_argument("--address", default=config.RETRIEVAL_SERVICE_ADDRESS or "tcp:127.0.0.1:7601",
+                        help="unix:/path.sock or tcp:host:port")
+    parser.add_argument("--pdf-folder", default="./datasets")
+    args = parser.parse_args()
+
+    service = RetrievalService(build_retriever(args.pdf_folder))
+    server = make_server(args.address, service)
+    print(f" * Retrieval service listening on {args.address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import queue
+import re
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from my_config import config
+
+_LINE_BREAK_RE = re.compile(r"\r\n|\r|\n")
+_END = object()
+
+
+def format_event(data: str, event: str = None) -> str:
+    """One SSE frame; multi-line payloads become one `data:` field per line (rejoined with \\n by the client)."""
+    head = f"event: {event}\n" if event else ""
+    return head + "".join(f"data: {line}\n" for line in _LINE_BREAK_RE.split(data)) + "\n"
+
+
+def stream_sse(upstream: Iterator[str], cancel=None, is_disconnected: Optional[Callable[[], bool]] = None,
+               window: float = None, max_chars: int = None, queue_size: int = None,
+               poll_interval: float = 0.25) -> Iterator[str]:
+    """Coalesce upstream text deltas into SSE frames, flushing when `max_chars` are buffered or `window` seconds
+    have passed since the first buffered delta; ends with `data: [DONE]`.
+
+    Upstream is read on a separate thread into a bounded queue, so a slow client pauses the upstream read
+    instead of buffering without limit. When the client goes away (this generator is closed, or
+    `is_disconnected()` turns true) `cancel` (models.dispatch.CancelToken) is fired to abort the LLM request.
+    """
+    window = window if window is not None else config.SSE_COALESCE_WINDOW
+    max_chars = max_chars if max_chars is not None else config.SSE_MAX_FRAME_CHARS
+    q: "queue.Queue" = queue.Queue(maxsize=queue_size or config.SSE_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for delta in upstream:
+                if not put(delta):
+                    return
+            put(_END)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(upstream, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=read, daemon=True, name="sse-reader").start()
+
+    buf, size, first_at = [], 0, None
+    try:
+        while True:
+            if buf:
+                timeout = max(0.0, min(poll_interval, first_at + window - time.monotonic()))
+            else:
+                timeout = poll_interval
+            try:
+                item = q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if is_disconnected is not None and is_disconnected():
+                return
+
+            if item is _END or isinstance(item, Exception):
+                if buf:
+                    yield format_event("".join(buf))
+                if isinstance(item, Exception):
+                    yield format_event(str(item), event="error")
+                else:
+                    yield format_event("[DONE]")
+                return
+            if item:
+                buf.append(item)
+                size += len(item)
+                if first_at is None:
+                    first_at = time.monotonic()
+            if buf and (size >= max_chars or time.monotonic() - first_at >= window):
+                yield format_event("".join(buf))
+                buf, size, first_at = [], 0, None
+    finally:
+        stop.set()
+        if cancel is not None:
+            cancel.cancel()
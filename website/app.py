@@ -2,28 +2,75 @@
 import sys
 import os
 import traceback
+import threading
 import requests
 from flask import Flask, request, jsonify, render_template, send_from_directory, Response
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from my_config import config
+from serving.admission import AdmissionGate, Overloaded
+from serving.sse import format_event, stream_sse
+from models.dispatch import CancelToken
+
+# Admission control: separate bounded slots for embedding/search and for LLM streams, each with a bounded wait queue
+search_gate = AdmissionGate('search', config.ADMISSION_SEARCH_CONCURRENCY, config.ADMISSION_QUEUE_SIZE, config.ADMISSION_QUEUE_TIMEOUT)
+llm_gate = AdmissionGate('llm', config.ADMISSION_LLM_CONCURRENCY, config.ADMISSION_QUEUE_SIZE, config.ADMISSION_QUEUE_TIMEOUT)
+
 _rag_system = None
+_rag_lock = threading.Lock()
 def get_rag_system():
     global _rag_system
     if _rag_system is None:
-        from main import AntimicrobialRAG
-        _rag_system = AntimicrobialRAG("../datasets")
+        # Only one build even if a burst arrives while the warm-up thread is still loading
+        with _rag_lock:
+            if _rag_system is None:
+                from main import AntimicrobialRAG
+                rag = AntimicrobialRAG("../datasets")
+                rag.search_gate = search_gate
+                rag.llm_gate = llm_gate
+                _rag_system = rag
     return _rag_system
 
 # Warm-up: pre-build/load index in background thread to reduce first request latency
 try:
-    import threading
     threading.Thread(target=get_rag_system, daemon=True).start()
 except Exception:
     pass
 
 
+def _conversation_id(data):
+    """Conversation key for follow-up reuse; only an explicit id from the client (None disables reuse)."""
+    conversation_id = data.get('conversation_id')
+    return str(conversation_id) if conversation_id else None
+
+
+def _requested_shards(data, rag):
+    """Validated optional shard subset from the request; returns (shards, error message)."""
+    shards = data.get('shards')
+    if shards is None:
+        return None, None
+    if not isinstance(shards, list) or not all(isinstance(n, str) for n in shards):
+        return None, 'shards must be a list of shard names'
+    unknown = [n for n in shards if n not in rag.shard_folders]
+    if unknown:
+        return None, f"Unknown shard(s): {', '.join(unknown)}"
+    return shards or None, None
+
+
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    """Shed load predictably: 429 with a Retry-After hint instead of queueing until timeout."""
+    resp = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp
+
+@app.route('/admission_stats', methods=['GET'])
+def admission_stats():
+    return jsonify({'search': search_gate.stats(), 'llm': llm_gate.stats()})
+
 @app.route('/images/<path:filename>')
 def images_files(filename):
     images_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'images'))
@@ -34,21 +81,39 @@ def ask_stream():
     data = request.get_json()
     question = data.get('question', '')
     messages = data.get('messages', [])
+    conversation_id = _conversation_id(data)
     if not question:
-        return Response('event: error\ndata: No question provided\n\n', mimetype='text/event-stream')
+        return Response(format_event('No question provided', event='error'), mimetype='text/event-stream')
     try:
         print(f"[ask_stream] Received question: {question}")
         rag = get_rag_system()
-
-        def generate():
-            for chunk in rag.stream_query(question):
-                yield f'data: {chunk}\n\n'
-            yield 'data: [DONE]\n\n'
-        return Response(generate(), mimetype='text/event-stream')
+        shards, error = _requested_shards(data, rag)  # optional subset of shard names
+        if error:
+            return jsonify({'error': error}), 400
+        cancel = CancelToken()
+        stream = rag.stream_query(question, shards=shards, conversation_id=conversation_id, cancel=cancel)
+        # Run admission (search, then LLM slot) before committing to a 200 so saturation can still become a 429
+        first = next(stream, None)
+
+        def upstream():
+            try:
+                if first is not None:
+                    yield first
+                yield from stream
+            finally:
+                stream.close()  # releases the LLM slot even if the client goes away
+
+        # Coalesced frames; a disconnect (write failure or waitress' client_disconnected) cancels the LLM request
+        body = stream_sse(upstream(), cancel=cancel,
+                          is_disconnected=request.environ.get('waitress.client_disconnected'))
+        return Response(body, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Overloaded:
+        raise
     except Exception as e:
         print('---RAG STREAM ERROR---')
         traceback.print_exc()
-        return Response(f'event: error\ndata: {str(e)}\n\n', mimetype='text/event-stream')
+        return Response(format_event(str(e), event='error'), mimetype='text/event-stream')
 
 @app.route('/')
 def index():
@@ -63,12 +128,18 @@ def ask():
     data = request.get_json()
     question = data.get('question', '')
     messages = data.get('messages', [])
+    conversation_id = _conversation_id(data)
     if not question:
         return jsonify({'error': 'No question provided'}), 400
     try:
         rag = get_rag_system()
-        answer = rag.query(question)
+        shards, error = _requested_shards(data, rag)  # optional subset of shard names
+        if error:
+            return jsonify({'error': error}), 400
+        answer = rag.query(question, shards=shards, conversation_id=conversation_id)
         return jsonify({'answer': answer})
+    except Overloaded:
+        raise
     except Exception as e:
         print('---RAG ERROR---')
         traceback.print_exc()
@@ -107,7 +178,14 @@ if __name__ == '__main__':
         print(' * Using waitress WSGI server')
         print(f' * Server running at http://{HOST}:{PORT} (open /)')
         print(' * SSE streaming endpoint: POST /ask_stream with JSON {"question": "..."}')
-        serve(app, host=HOST, port=PORT)
+        # Each request (and each SSE stream) holds a waitress thread, so there must be enough threads to fill
+        # every gate slot and queue place; otherwise excess requests wait in waitress' unbounded task queue
+        # instead of getting a 429. A few spare threads keep the page, static files and stats responsive.
+        threads = (config.ADMISSION_SEARCH_CONCURRENCY + config.ADMISSION_LLM_CONCURRENCY
+                   + 2 * config.ADMISSION_QUEUE_SIZE + 4)
+        print(f' * {threads} worker threads (sized from the admission gates)')
+        # Request lookahead lets waitress report client disconnects to streaming responses
+        serve(app, host=HOST, port=PORT, threads=threads, channel_request_lookahead=1)
     except ImportError:
         print('Please install waitress first with pip install waitress, or use gunicorn or other production servers.\nTemporarily using Flask development server:')
         print(f' * Server running at http://{HOST}:{PORT} (open /)')